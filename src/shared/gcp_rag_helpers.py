@@ -1,12 +1,211 @@
-import json
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import hashlib
+import heapq
+import itertools
+import logging
 import os
-
+from pathlib import Path
+import pickle
+import stat
+import tempfile
+import threading
+import time
+
+from cachetools import TTLCache
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import storage
-import vertexai
-from vertexai import rag
+from google.cloud.storage import transfer_manager
+from google.cloud.storage.retry import DEFAULT_RETRY
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Files above this size use resumable uploads sent in CHUNKED_UPLOAD_SIZE pieces
+RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+# Must be a multiple of 256 KiB
+CHUNKED_UPLOAD_SIZE = 16 * 1024 * 1024
+# Files above this size may be uploaded as parallel chunks when requested
+PARALLEL_UPLOAD_THRESHOLD = 100 * 1024 * 1024
+UPLOAD_TIMEOUT = 300
+# The storage client's requests session keeps at most 10 pooled connections;
+# more concurrent uploads would open (and discard) extra TLS connections
+MAX_UPLOAD_WORKERS = 10
+
+# In-memory cache of list_corpus_files results, created on first use so
+# CORPUS_LIST_TTL can come from a .env loaded after import
+_corpus_files_cache: TTLCache | None = None
+_corpus_files_lock = threading.Lock()
+
+# vertexai.rag, loaded by _get_rag()
+_rag = None
+
+
+@functools.lru_cache(maxsize=1)
+def _init_vertex() -> tuple[str, str]:
+    """
+    Initialize Vertex AI once per process from GCP_PROJECT_ID and GCP_LOCATION.
 
+    Returns:
+        Tuple of (project_id, location)
+    """
+    project_id = os.getenv("GCP_PROJECT_ID")
+    location = os.getenv("GCP_LOCATION")
 
-def upload_to_gcs(local_file: str, bucket: str, dest_blob: str) -> str:
+    if not project_id:
+        raise ValueError("GCP_PROJECT_ID environment variable is required")
+    if not location:
+        raise ValueError("GCP_LOCATION environment variable is required")
+
+    import vertexai
+
+    vertexai.init(project=project_id, location=location)
+    return project_id, location
+
+
+def _get_rag():
+    """
+    Import vertexai.rag on first use; it pulls in gRPC and protobuf and is slow to load.
+    """
+    global _rag
+    if _rag is None:
+        from vertexai import rag
+
+        _rag = rag
+    return _rag
+
+
+@functools.lru_cache(maxsize=1)
+def _get_storage_client() -> storage.Client:
+    """
+    Return a process-wide storage client so credential discovery happens once.
+    """
+    return storage.Client()
+
+
+def _upload_blob(
+    blob: storage.Blob, local_file: str, overwrite: bool, composite: bool
+) -> None:
+    """
+    Upload a single file, switching to chunked resumable uploads for large files.
+    With overwrite=False the upload only creates new objects (if_generation_match=0)
+    and raises PreconditionFailed if the object already exists.
+    """
+    if composite:
+        # The multipart upload takes no precondition, so check for the object first
+        if not overwrite and blob.exists():
+            raise PreconditionFailed(
+                f"gs://{blob.bucket.name}/{blob.name} already exists"
+            )
+        # Threads, not processes: forking a multithreaded process with open
+        # sessions can deadlock. Bounded by the shared client's connection pool.
+        transfer_manager.upload_chunks_concurrently(
+            local_file,
+            blob,
+            chunk_size=CHUNKED_UPLOAD_SIZE,
+            worker_type=transfer_manager.THREAD,
+            max_workers=MAX_UPLOAD_WORKERS,
+        )
+        return
+
+    if os.path.getsize(local_file) > RESUMABLE_UPLOAD_THRESHOLD:
+        blob.chunk_size = CHUNKED_UPLOAD_SIZE
+
+    blob.upload_from_filename(
+        local_file,
+        if_generation_match=None if overwrite else 0,
+        timeout=UPLOAD_TIMEOUT,
+        retry=DEFAULT_RETRY,
+    )
+
+
+def _upload_many_to_gcs(
+    pairs: list[tuple[str, str]],
+    bucket: str,
+    max_workers: int,
+    use_parallel_composite: bool,
+    overwrite: bool,
+) -> list[tuple[str, bool]]:
+    """
+    Upload files and return (gcs_uri, uploaded) for each pair, where uploaded is
+    False if overwrite=False and the object already existed and was left untouched.
+    """
+    bucket_name = bucket.replace("gs://", "")
+    gcs_bucket = _get_storage_client().bucket(bucket_name)
+
+    def _upload(pair: tuple[str, str], composite: bool = False) -> tuple[str, bool]:
+        local_file, dest_blob = pair
+        gcs_uri = f"gs://{bucket_name}/{dest_blob}"
+        try:
+            _upload_blob(gcs_bucket.blob(dest_blob), local_file, overwrite, composite)
+        except PreconditionFailed:
+            logger.warning(
+                "Skipped %s: %s already exists and was not overwritten",
+                local_file,
+                gcs_uri,
+            )
+            return gcs_uri, False
+        logger.debug("Uploaded: %s", gcs_uri)
+        return gcs_uri, True
+
+    composite = [
+        use_parallel_composite
+        and os.path.getsize(local_file) > PARALLEL_UPLOAD_THRESHOLD
+        for local_file, _ in pairs
+    ]
+    results: list[tuple[str, bool] | None] = [None] * len(pairs)
+
+    regular = [i for i, is_composite in enumerate(composite) if not is_composite]
+    if regular:
+        workers = max(1, min(max_workers, len(regular)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            regular_results = pool.map(_upload, [pairs[i] for i in regular])
+            for i, result in zip(regular, regular_results):
+                results[i] = result
+
+    # Composite uploads already run their chunks concurrently, so do them one at a
+    # time outside the pool to keep the total within the client's connection pool
+    for i, is_composite in enumerate(composite):
+        if is_composite:
+            results[i] = _upload(pairs[i], composite=True)
+
+    return results
+
+
+def upload_many_to_gcs(
+    pairs: list[tuple[str, str]],
+    bucket: str,
+    max_workers: int = MAX_UPLOAD_WORKERS,
+    use_parallel_composite: bool = False,
+    overwrite: bool = True,
+) -> list[str]:
+    """
+    Upload several files to Google Cloud Storage concurrently.
+
+    Args:
+        pairs: List of (local_file, dest_blob) tuples to upload
+        bucket: Name of the GCS bucket
+        max_workers: Maximum number of concurrent uploads (default: 10, the client's connection pool size)
+        use_parallel_composite: Upload files over 100 MiB as concurrent chunks (default: False)
+        overwrite: Replace objects that already exist; if False they are left untouched
+                   and a warning is logged (default: True)
+
+    Returns:
+        List of GCS URIs (gs://bucket/path), in the same order as pairs
+    """
+    results = _upload_many_to_gcs(
+        pairs, bucket, max_workers, use_parallel_composite, overwrite
+    )
+    return [gcs_uri for gcs_uri, _ in results]
+
+
+def upload_to_gcs(
+    local_file: str,
+    bucket: str,
+    dest_blob: str,
+    use_parallel_composite: bool = False,
+    overwrite: bool = True,
+) -> str:
     """
     Upload a file to Google Cloud Storage.
 
@@ -14,47 +213,55 @@ def upload_to_gcs(local_file: str, bucket: str, dest_blob: str) -> str:
         local_file: Path to the local file to upload
         bucket: Name of the GCS bucket
         dest_blob: Destination path/name in the bucket
+        use_parallel_composite: Upload files over 100 MiB as concurrent chunks (default: False)
+        overwrite: Replace the object if it already exists (default: True)
 
     Returns:
         GCS URI (gs://bucket/path)
     """
-    storage_client = storage.Client()
-    bucket_name = bucket.replace("gs://", "")
-    blob = storage_client.bucket(bucket_name).blob(dest_blob)
-    blob.upload_from_filename(local_file)
-    gcs_uri = f"gs://{bucket_name}/{dest_blob}"
-    print(f"Uploaded: {gcs_uri}")
-    return gcs_uri
+    return upload_many_to_gcs(
+        [(local_file, dest_blob)],
+        bucket,
+        use_parallel_composite=use_parallel_composite,
+        overwrite=overwrite,
+    )[0]
 
 
 def import_files_to_rag_corpus(
     corpus_name: str,
     gcs_uris: list[str],
-    chunk_size: int = 1024,
-    chunk_overlap: int = 256,
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
 ) -> dict:
     """
     Import files from GCS into a Vertex AI RAG corpus.
     Uses GCP_PROJECT_ID and GCP_LOCATION from environment variables.
+    RAG_CHUNK_SIZE and RAG_CHUNK_OVERLAP, when set, replace the default chunking;
+    explicit arguments always take precedence.
+
+    Smaller chunks (e.g. 128/64) suit fact lookups such as dates, figures and names;
+    larger chunks (e.g. 512/100) keep more surrounding text for descriptive questions.
 
     Args:
         corpus_name: Full corpus name (projects/{project}/locations/{location}/ragCorpora/{id})
         gcs_uris: List of GCS URIs to import (gs://bucket/path)
-        chunk_size: Size of each text chunk (default: 1024)
-        chunk_overlap: Overlap between chunks (default: 256)
+        chunk_size: Size of each text chunk (default: RAG_CHUNK_SIZE, else 512)
+        chunk_overlap: Overlap between chunks (default: RAG_CHUNK_OVERLAP, else 100)
 
     Returns:
         Dictionary with import results
     """
-    project_id = os.getenv("GCP_PROJECT_ID")
-    location = os.getenv("GCP_LOCATION")
-
-    if not project_id:
-        raise ValueError("GCP_PROJECT_ID environment variable is required")
-    if not location:
-        raise ValueError("GCP_LOCATION environment variable is required")
-
-    vertexai.init(project=project_id, location=location)
+    if chunk_size is None:
+        chunk_size = int(os.getenv("RAG_CHUNK_SIZE", "512"))
+    if chunk_overlap is None:
+        chunk_overlap = int(os.getenv("RAG_CHUNK_OVERLAP", "100"))
+    if chunk_overlap >= chunk_size:
+        raise ValueError(
+            f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})"
+        )
+
+    _init_vertex()
+    rag = _get_rag()
     resp = rag.import_files(
         corpus_name=corpus_name,
         paths=gcs_uris,
@@ -67,78 +274,269 @@ def import_files_to_rag_corpus(
         "imported_count": resp.imported_rag_files_count,
         "skipped_count": resp.skipped_rag_files_count,
     }
-    print(f"Imported: {result['imported_count']}, Skipped: {result['skipped_count']}")
+    logger.info(
+        "Imported: %s, Skipped: %s", result["imported_count"], result["skipped_count"]
+    )
+    clear_corpus_files_cache()
     return result
 
 
-def list_corpus_files(corpus_name: str) -> list:
+def _corpus_files_ttl() -> int:
+    return int(os.getenv("CORPUS_LIST_TTL", "300"))
+
+
+def _corpus_files_disk_path(cache_key: str) -> Path | None:
     """
-    List all files in the RAG corpus with metadata.
+    Return the on-disk cache file for a listing, or None if CORPUS_LIST_CACHE_DIR is unset.
+    """
+    cache_dir = os.getenv("CORPUS_LIST_CACHE_DIR")
+    if not cache_dir:
+        return None
+    digest = hashlib.sha256(cache_key.encode()).hexdigest()[:16]
+    return Path(cache_dir).expanduser() / f"corpus_{digest}.pkl"
+
+
+def _is_private(path: Path) -> bool:
+    """
+    Check that path is owned by the current user and not writable by anyone else.
+    Unpickling runs code, so cache files anyone else could have written are never loaded.
+    """
+    st = path.stat()
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return False
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _load_corpus_files_from_disk(cache_key: str) -> list | None:
+    path = _corpus_files_disk_path(cache_key)
+    if path is None:
+        return None
+    try:
+        if time.time() - path.stat().st_mtime > _corpus_files_ttl():
+            return None
+        if not (_is_private(path.parent) and _is_private(path)):
+            logger.warning(
+                "Ignoring corpus file cache %s: not private to this user", path
+            )
+            return None
+        with path.open("rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+        # Missing, unreadable, or written by an incompatible library version; list afresh
+        return None
+
+
+def _save_corpus_files_to_disk(cache_key: str, files: list) -> None:
+    path = _corpus_files_disk_path(cache_key)
+    if path is None:
+        return
+    tmp_name = None
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Write to a temp file first so concurrent readers never see a partial pickle
+        with tempfile.NamedTemporaryFile("wb", dir=path.parent, delete=False) as f:
+            tmp_name = f.name
+            pickle.dump(files, f)
+        os.replace(tmp_name, path)
+    except (OSError, TypeError, pickle.PickleError) as e:
+        logger.warning("Could not write corpus file cache %s: %s", path, e)
+        if tmp_name is not None:
+            Path(tmp_name).unlink(missing_ok=True)
+
+
+def clear_corpus_files_cache() -> None:
+    """
+    Drop cached list_corpus_files results, in memory and on disk.
+    Called by every helper that adds files to a corpus.
+    """
+    with _corpus_files_lock:
+        if _corpus_files_cache is not None:
+            _corpus_files_cache.clear()
+
+    # Callers have already changed the corpus, so a cache problem must not fail them
+    cache_dir = os.getenv("CORPUS_LIST_CACHE_DIR")
+    if cache_dir:
+        try:
+            for path in Path(cache_dir).expanduser().glob("corpus_*.pkl"):
+                path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("Could not clear corpus file cache in %s: %s", cache_dir, e)
+
+
+def list_corpus_files(corpus_name: str, limit: int | None = None) -> list:
+    """
+    List files in the RAG corpus with metadata.
+    Results are cached per corpus and limit for CORPUS_LIST_TTL seconds (default: 300),
+    and additionally pickled to CORPUS_LIST_CACHE_DIR when that variable is set.
 
     Args:
         corpus_name: Full corpus name (projects/{project}/locations/{location}/ragCorpora/{id})
+        limit: Maximum number of files to return; later result pages are never fetched (default: all)
 
     Returns:
         List of RagFile objects with metadata like display_name, size_bytes, rag_file_chunks_count
     """
-    project_id = os.getenv("GCP_PROJECT_ID")
-    location = os.getenv("GCP_LOCATION")
+    global _corpus_files_cache
+
+    cache_key = corpus_name if limit is None else f"{corpus_name}?limit={limit}"
+    with _corpus_files_lock:
+        if _corpus_files_cache is None:
+            _corpus_files_cache = TTLCache(maxsize=32, ttl=_corpus_files_ttl())
+        files = _corpus_files_cache.get(cache_key)
+    if files is not None:
+        return list(files)
+
+    # Disk hits are not copied into memory: that would restart their TTL
+    files = _load_corpus_files_from_disk(cache_key)
+    if files is not None:
+        return files
+
+    _init_vertex()
+    rag = _get_rag()
+    # The pager fetches pages lazily, so stopping early skips the remaining RPCs
+    files = list(itertools.islice(rag.list_files(corpus_name=corpus_name), limit))
+    _save_corpus_files_to_disk(cache_key, files)
+
+    with _corpus_files_lock:
+        _corpus_files_cache[cache_key] = files
+    return list(files)
 
-    if not project_id:
-        raise ValueError("GCP_PROJECT_ID environment variable is required")
-    if not location:
-        raise ValueError("GCP_LOCATION environment variable is required")
 
-    vertexai.init(project=project_id, location=location)
-    files = rag.list_files(corpus_name=corpus_name)
-    return list(files)
+def retrieval_query(corpus_name: str, text: str, top_k: int = 5):
+    """
+    Run a semantic retrieval query against a RAG corpus.
+
+    Args:
+        corpus_name: Full corpus name (projects/{project}/locations/{location}/ragCorpora/{id})
+        text: Query text to retrieve contexts for
+        top_k: Number of contexts to return (default: 5)
+
+    Returns:
+        RetrieveContextsResponse with the matching contexts
+    """
+    _init_vertex()
+    rag = _get_rag()
+    return rag.retrieval_query(
+        rag_resources=[rag.RagResource(rag_corpus=corpus_name)],
+        text=text,
+        rag_retrieval_config=rag.RagRetrievalConfig(top_k=top_k),
+    )
 
 
-def upload_file_by_index(
-    index: int,
+@functools.lru_cache(maxsize=8)
+def _scan_files_dir(files_dir: str, mtime_ns: int) -> tuple[str, ...]:
+    """
+    List the regular files in files_dir (unsorted).
+    mtime_ns is part of the cache key so the listing refreshes when the directory changes.
+    """
+    with os.scandir(files_dir) as entries:
+        return tuple(entry.name for entry in entries if entry.is_file())
+
+
+def upload_files_by_indices(
+    indices: list[int],
     bucket: str,
     corpus_name: str,
     files_dir: str = "files_to_upload",
-    chunk_size: int = 1024,
-    chunk_overlap: int = 256,
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+    overwrite: bool = True,
 ) -> dict:
     """
-    Upload a file from files_to_upload directory by index and import to RAG corpus.
+    Upload files from files_to_upload directory by index and import them to RAG corpus.
+    Files are uploaded concurrently and imported with a single import request.
+    Every file is passed to the import, including ones kept as they were with
+    overwrite=False; Vertex skips files that are already imported and unchanged.
 
     Args:
-        index: Index of the file to upload (0, 1, 2, etc.)
+        indices: Indices of the files to upload (0, 1, 2, etc.); duplicates are ignored
         bucket: Name of the GCS bucket
         corpus_name: Full corpus name (projects/{project}/locations/{location}/ragCorpora/{id})
         files_dir: Directory containing files to upload (default: "files_to_upload")
-        chunk_size: Size of each text chunk (default: 1024)
-        chunk_overlap: Overlap between chunks (default: 256)
+        chunk_size: Size of each text chunk (default: RAG_CHUNK_SIZE, else 512)
+        chunk_overlap: Overlap between chunks (default: RAG_CHUNK_OVERLAP, else 100)
+        overwrite: Replace objects that already exist in the bucket (default: True)
 
     Returns:
-        Dictionary with file name, GCS URI, and import results
+        Dictionary with a "files" list of file names, GCS URIs and whether each was
+        uploaded, and the import results
     """
-    files = sorted(os.listdir(files_dir))
-    if index < 0 or index >= len(files):
-        raise IndexError(f"Index {index} out of range. Found {len(files)} files.")
-
-    filename = files[index]
-    print(f"Uploading file: {filename}")
-    local_path = os.path.join(files_dir, filename)
+    # Drop duplicates (keeping order) so a file is uploaded and imported only once
+    indices = list(dict.fromkeys(indices))
+    if not indices:
+        return {"files": [], "imported_count": 0, "skipped_count": 0}
+
+    files = _scan_files_dir(files_dir, os.stat(files_dir).st_mtime_ns)
+    for index in indices:
+        if index < 0 or index >= len(files):
+            raise IndexError(f"Index {index} out of range. Found {len(files)} files.")
+
+    # Only the names up to the largest index need to be ordered
+    smallest = heapq.nsmallest(max(indices) + 1, files)
+    filenames = [smallest[index] for index in indices]
+    logger.info("Uploading files: %s", ", ".join(filenames))
+
+    uploads = _upload_many_to_gcs(
+        [(os.path.join(files_dir, filename), filename) for filename in filenames],
+        bucket,
+        max_workers=MAX_UPLOAD_WORKERS,
+        use_parallel_composite=False,
+        overwrite=overwrite,
+    )
 
-    gcs_uri = upload_to_gcs(local_path, bucket, filename)
     import_result = import_files_to_rag_corpus(
         corpus_name=corpus_name,
-        gcs_uris=[gcs_uri],
+        gcs_uris=[gcs_uri for gcs_uri, _ in uploads],
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
     )
 
     return {
-        "filename": filename,
-        "gcs_uri": gcs_uri,
+        "files": [
+            {"filename": filename, "gcs_uri": gcs_uri, "uploaded": uploaded}
+            for filename, (gcs_uri, uploaded) in zip(filenames, uploads)
+        ],
         **import_result,
     }
 
 
+def upload_file_by_index(
+    index: int,
+    bucket: str,
+    corpus_name: str,
+    files_dir: str = "files_to_upload",
+    chunk_size: int | None = None,
+    chunk_overlap: int | None = None,
+    overwrite: bool = True,
+) -> dict:
+    """
+    Upload a file from files_to_upload directory by index and import to RAG corpus.
+
+    Args:
+        index: Index of the file to upload (0, 1, 2, etc.)
+        bucket: Name of the GCS bucket
+        corpus_name: Full corpus name (projects/{project}/locations/{location}/ragCorpora/{id})
+        files_dir: Directory containing files to upload (default: "files_to_upload")
+        chunk_size: Size of each text chunk (default: RAG_CHUNK_SIZE, else 512)
+        chunk_overlap: Overlap between chunks (default: RAG_CHUNK_OVERLAP, else 100)
+        overwrite: Replace the object if it already exists in the bucket (default: True)
+
+    Returns:
+        Dictionary with file name, GCS URI, whether it was uploaded, and import results
+    """
+    result = upload_files_by_indices(
+        [index],
+        bucket=bucket,
+        corpus_name=corpus_name,
+        files_dir=files_dir,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        overwrite=overwrite,
+    )
+    uploaded = result.pop("files")
+    return {**uploaded[0], **result}
+
+
 def upload_file_with_metadata(
     corpus_name: str,
     file_path: str,
@@ -161,27 +559,22 @@ def upload_file_with_metadata(
     Returns:
         Dictionary with upload results and metadata
     """
-    project_id = os.getenv("GCP_PROJECT_ID")
-    location = os.getenv("GCP_LOCATION")
-
-    if not project_id:
-        raise ValueError("GCP_PROJECT_ID environment variable is required")
-    if not location:
-        raise ValueError("GCP_LOCATION environment variable is required")
-
     # Use filename as display_name if not provided
     if not display_name:
         display_name = os.path.basename(file_path)
 
-    vertexai.init(project=project_id, location=location)
+    _init_vertex()
+    rag = _get_rag()
 
-    print(f"Uploading file with metadata: {display_name}")
+    logger.info("Uploading file with metadata: %s", display_name)
 
     # Convert user_metadata dict to JSON string if provided
     metadata_json = None
     if user_metadata:
-        metadata_json = json.dumps(user_metadata)
-        print(f"  Custom metadata: {metadata_json}")
+        metadata_json = orjson.dumps(
+            user_metadata, option=orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+        logger.debug("Custom metadata: %s", metadata_json)
 
     rag_file = rag.upload_file(
         corpus_name=corpus_name,
@@ -197,5 +590,6 @@ def upload_file_with_metadata(
         "user_metadata": rag_file.user_metadata if rag_file.user_metadata else "",
         "file_resource": str(rag_file.name),
     }
-    print(f"Uploaded with metadata: {result}")
+    logger.info("Uploaded with metadata: %s", result)
+    clear_corpus_files_cache()
     return result
@@ -1,19 +1,54 @@
+import functools
 import os
 
 from dotenv import load_dotenv
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 load_dotenv()
 
 
-def get_lc_llm() -> ChatGoogleGenerativeAI:
+def _llm_config() -> tuple[str, str | None, str, float, int]:
     temperature_str = os.getenv("VERTEX_TEMPERATURE")
     temp = float(temperature_str) if temperature_str else 0.7
 
+    return (
+        os.getenv("VERTEX_MODEL", "gemini-2.5-flash"),
+        os.getenv("GCP_PROJECT_ID"),
+        os.getenv("GCP_LOCATION", "us-central1"),
+        temp,
+        int(os.getenv("VERTEX_MAX_TOKENS", "8192")),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _build_llm(
+    model: str,
+    project: str | None,
+    location: str,
+    temperature: float,
+    max_tokens: int,
+) -> ChatGoogleGenerativeAI:
     return ChatGoogleGenerativeAI(
-        model=os.getenv("VERTEX_MODEL", "gemini-2.5-flash"),
-        project=os.getenv("GCP_PROJECT_ID"),
-        location=os.getenv("GCP_LOCATION", "us-central1"),
-        temperature=temp,
-        max_output_tokens=int(os.getenv("VERTEX_MAX_TOKENS", "8192")),
+        model=model,
+        project=project,
+        location=location,
+        temperature=temperature,
+        max_output_tokens=max_tokens,
     )
+
+
+@functools.lru_cache(maxsize=8)
+def _build_structured_llm(schema: type, *config) -> Runnable:
+    return _build_llm(*config).with_structured_output(schema)
+
+
+def get_lc_llm() -> ChatGoogleGenerativeAI:
+    return _build_llm(*_llm_config())
+
+
+def get_structured_lc_llm(schema: type) -> Runnable:
+    """
+    Return get_lc_llm() bound to a structured output schema, reusing the binding across calls.
+    """
+    return _build_structured_llm(schema, *_llm_config())
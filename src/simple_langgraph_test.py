@@ -1,3 +1,6 @@
+import asyncio
+from dataclasses import dataclass
+import logging
 import os
 from typing import Annotated, Literal, Optional, Sequence
 import warnings
@@ -6,12 +9,14 @@ from dotenv import load_dotenv
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
-from pydantic import BaseModel, Field
-import vertexai
-from vertexai import rag
+from pydantic import BaseModel, ConfigDict, Field, SkipValidation
 
-from shared.gcp_rag_helpers import list_corpus_files, upload_file_by_index
-from shared.lc_llm import get_lc_llm
+from shared.gcp_rag_helpers import (
+    list_corpus_files,
+    retrieval_query,
+    upload_file_by_index,
+)
+from shared.lc_llm import get_lc_llm, get_structured_lc_llm
 
 warnings.filterwarnings(
     "ignore",
@@ -19,6 +24,21 @@ warnings.filterwarnings(
 )
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Static prompts, built once at import
+QUESTION_TYPE_SYSTEM_MESSAGE = SystemMessage(
+    content=(
+        "Analyze the user's question and determine its type:\n"
+        "1. 'corpus_overview' - if asking about all files, listing files, or general overview of the knowledge base\n"
+        "2. 'specific_query' - if asking a specific question that needs to be answered from particular file(s)\n\n"
+        "Respond with ONLY 'corpus_overview' or 'specific_query'."
+    )
+)
+SUMMARY_SYSTEM_MESSAGE = SystemMessage(
+    content="You are a helpful assistant. Answer the user's question using the provided context."
+)
+
 
 class FileListResponse(BaseModel):
     """Structured response for file listing queries."""
@@ -37,7 +57,8 @@ class QuestionTypeResponse(BaseModel):
     question_type: Optional[Literal["corpus_overview", "specific_query"]] = None
 
 
-class CorpusData(BaseModel):
+@dataclass(slots=True, frozen=True)
+class CorpusData:
     """Data for a single file in the corpus."""
 
     name: str
@@ -52,164 +73,194 @@ class CorpusData(BaseModel):
 class GraphState(BaseModel):
     """State with messages and file listing metadata."""
 
+    model_config = ConfigDict(arbitrary_types_allowed=True, validate_assignment=False)
+
     messages: Annotated[Sequence[BaseMessage], add_messages]
     question_type: Optional[Literal["corpus_overview", "specific_query"]] = None
-    corpus_data: Optional[list[CorpusData]] = None
+    # Built from trusted API data, so state updates don't re-validate every item
+    corpus_data: SkipValidation[Optional[list[CorpusData]]] = None
+    corpus_task: Optional[asyncio.Task] = None
+    retrieve_task: Optional[asyncio.Task] = None
+    # True when corpus_data holds only the first MAX_CORPUS_FILES files
+    truncated: bool = False
+
+
+def _file_state(file_status) -> str:
+    """Convert a RagFile status enum (e.g. State.ACTIVE) to its name."""
+    state = getattr(file_status, "state", None)
+    return str(state).rsplit(".", 1)[-1] if state is not None else "UNKNOWN"
+
+
+def _first_gcs_uri(gcs_source) -> str:
+    """Return the first URI of a RagFile GCS source (a repeated field)."""
+    uris = getattr(gcs_source, "uris", None)
+    return uris[0] if uris else "N/A"
+
+
+def _max_corpus_files() -> int:
+    return int(os.getenv("MAX_CORPUS_FILES", "500"))
+
+
+def _start_background(func, *args) -> asyncio.Task:
+    """
+    Run a blocking helper in a worker thread as a task. Only one of the prefetched
+    results is awaited, so the other task's exception is marked as retrieved here.
+    """
+    task = asyncio.create_task(asyncio.to_thread(func, *args))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
+
+def _drop_prefetch(unused: Optional[asyncio.Task]) -> dict:
+    """
+    Cancel the prefetch task for the route not taken and clear both tasks from state.
+    Cancelling only helps if the call has not started yet; a running thread finishes.
+    """
+    if unused is not None:
+        unused.cancel()
+    return {"corpus_task": None, "retrieve_task": None}
 
 
 # NODES
-def upload_node(state: GraphState) -> dict:
+async def upload_node(state: GraphState) -> dict:
     """
     Upload the file at index 1 from files_to_upload and import to RAG corpus.
     """
     bucket = os.getenv("GCS_BUCKET")
     corpus = os.getenv("RAG_CORPUS")
     if not bucket or not corpus:
-        print("\n[ERROR] GCS_BUCKET and RAG_CORPUS env vars must be set for upload.")
+        logger.error("GCS_BUCKET and RAG_CORPUS env vars must be set for upload.")
         return {"messages": []}
 
-    print(f"\n[INFO] Starting upload and RAG import for file at index 1...")
-    result = upload_file_by_index(index=1, bucket=bucket, corpus_name=corpus)
-    print(f"[INFO] Upload/Import result: {result}")
+    logger.info("Starting upload and RAG import for file at index 1...")
+    result = await asyncio.to_thread(
+        upload_file_by_index, index=1, bucket=bucket, corpus_name=corpus
+    )
+    logger.info("Upload/Import result: %s", result)
     return {"messages": []}
 
 
-def retrieve_node(state: GraphState) -> dict:
+async def prefetch_node(state: GraphState) -> dict:
     """
-    Retrieve relevant context from Vertex AI RAG Engine for specific queries.
+    Start the corpus listing and RAG retrieval in the background so they overlap
+    with question type determination. The routed node waits on its result.
+
+    The call for the route not taken is deliberately wasted: it trades an extra
+    Vertex call (several list pages when the corpus cache is cold) for not waiting
+    on the classification first. A started call cannot be interrupted, so
+    asyncio.run waits for it to finish at exit.
     """
     corpus = os.getenv("RAG_CORPUS")
-    project = os.getenv("GCP_PROJECT_ID")
-    location = os.getenv("GCP_LOCATION")
     top_k = int(os.getenv("RAG_TOP_K", "5"))
     user_message = state.messages[-1].content
 
     if not corpus:
         raise ValueError("RAG_CORPUS environment variable is required")
-    if not project:
-        raise ValueError("GCP_PROJECT_ID environment variable is required")
-    if not location:
-        raise ValueError("GCP_LOCATION environment variable is required")
 
-    # Perform semantic retrieval
+    return {
+        # One extra file tells corpus_data_node whether the listing was cut short
+        "corpus_task": _start_background(
+            list_corpus_files, corpus, _max_corpus_files() + 1
+        ),
+        "retrieve_task": _start_background(
+            retrieval_query, corpus, user_message, top_k
+        ),
+    }
+
+
+async def retrieve_node(state: GraphState) -> dict:
+    """
+    Retrieve relevant context from Vertex AI RAG Engine for specific queries.
+    """
+    cleared = _drop_prefetch(state.corpus_task)
+
+    # Wait for the semantic retrieval started by prefetch_node
     try:
-        vertexai.init(project=project, location=location)
-        resp = rag.retrieval_query(
-            rag_resources=[rag.RagResource(rag_corpus=corpus)],
-            text=user_message,
-            rag_retrieval_config=rag.RagRetrievalConfig(top_k=top_k),
-        )
+        resp = await state.retrieve_task
     except Exception as e:
-        print(f"\n[ERROR] RAG retrieval failed: {e}")
+        logger.error("RAG retrieval failed: %s", e)
         raise
 
     # Extract and format context from response
-    context_texts = []
-    if hasattr(resp, "contexts"):
-        contexts = (
-            resp.contexts
-            if not hasattr(resp.contexts, "contexts")
-            else resp.contexts.contexts
-        )
-        context_texts = [c.text for c in contexts if hasattr(c, "text")]
-
+    try:
+        contexts = resp.contexts.contexts
+    except AttributeError:
+        contexts = getattr(resp, "contexts", ())
     context_text = (
-        "\n\n".join(context_texts)
-        if context_texts
-        else "No relevant context was found in the knowledge base."
+        "\n\n".join(c.text for c in contexts if getattr(c, "text", None))
+        or "No relevant context was found in the knowledge base."
     )
 
     return {
-        "messages": [AIMessage(content=context_text, metadata={"type": "rag_context"})]
+        "messages": [AIMessage(content=context_text, metadata={"type": "rag_context"})],
+        **cleared,
     }
 
 
-def corpus_data_node(state: GraphState) -> dict:
+async def corpus_data_node(state: GraphState) -> dict:
     """
     Provides file data for corpus overview queries.
-    Fetches and lists all available files in the corpus with detailed metadata.
+    Fetches and lists up to MAX_CORPUS_FILES files in the corpus with detailed metadata.
     """
-    corpus = os.getenv("RAG_CORPUS")
-
-    files = list_corpus_files(corpus)
-
-    # Extract metadata from each file
-    corpus_data_list = []
-    for f in files:
-        # Extract status and convert to string
-        status = "UNKNOWN"
-        if hasattr(f, "file_status") and hasattr(f.file_status, "state"):
-            status = str(f.file_status.state).split(".")[-1]  # Convert enum to string
-
-        # Extract GCS URI and convert to string
-        gcs_uri = "N/A"
-        if f.gcs_source and f.gcs_source.uris:
-            # uris is a repeated field (list), take first URI
-            uris = list(f.gcs_source.uris)
-            gcs_uri = uris[0] if uris else "N/A"
-
-        corpus_data_list.append(
-            CorpusData(
-                name=f.display_name,
-                description=f.description if f.description else "",
-                status=status,
-                gcs_uri=gcs_uri,
-                created=str(f.create_time) if f.create_time else "N/A",
-                updated=str(f.update_time) if f.update_time else "N/A",
-                user_metadata=(
-                    f.user_metadata
-                    if hasattr(f, "user_metadata") and f.user_metadata
-                    else None
-                ),
-            )
+    cleared = _drop_prefetch(state.retrieve_task)
+    files = await state.corpus_task
+    max_files = _max_corpus_files()
+
+    corpus_data_list = [
+        CorpusData(
+            name=f.display_name,
+            description=f.description or "",
+            status=_file_state(getattr(f, "file_status", None)),
+            gcs_uri=_first_gcs_uri(getattr(f, "gcs_source", None)),
+            created=str(f.create_time) if f.create_time else "N/A",
+            updated=str(f.update_time) if f.update_time else "N/A",
+            user_metadata=getattr(f, "user_metadata", None) or None,
         )
+        for f in files[:max_files]
+    ]
 
     return {
         "corpus_data": corpus_data_list,
+        "truncated": len(files) > max_files,
+        **cleared,
     }
 
 
-def determine_question_type(state: GraphState) -> dict:
+async def determine_question_type(state: GraphState) -> dict:
     """
     Node that utilizes the LLM to determine the type of question being asked.
     Determines if the question is about the entire corpus or seeking specific information.
     """
-    llm = get_lc_llm()
-    structured_llm = llm.with_structured_output(QuestionTypeResponse)
-
-    response = structured_llm.invoke(
-        [
-            SystemMessage(
-                content=(
-                    "Analyze the user's question and determine its type:\n"
-                    "1. 'corpus_overview' - if asking about all files, listing files, or general overview of the knowledge base\n"
-                    "2. 'specific_query' - if asking a specific question that needs to be answered from particular file(s)\n\n"
-                    "Respond with ONLY 'corpus_overview' or 'specific_query'."
-                )
-            ),
-            state.messages[-1],
-        ]
+    structured_llm = get_structured_lc_llm(QuestionTypeResponse)
+    response = await structured_llm.ainvoke(
+        [QUESTION_TYPE_SYSTEM_MESSAGE, state.messages[-1]]
     )
 
-    print(f"\n[INFO] Question type determined: {response.question_type}")
+    logger.info("Question type determined: %s", response.question_type)
 
     return {
         "question_type": response.question_type,
     }
 
 
-def summary_node(state: GraphState) -> dict:
+async def summary_node(state: GraphState) -> dict:
     """
     Node that generates the final answer based on messages and context.
     """
     llm = get_lc_llm()
 
-    system_message = SystemMessage(
-        content="You are a helpful assistant. Answer the user's question using the provided context."
-    )
-
-    prompt_messages: list[BaseMessage] = [system_message] + list(state.messages)
-    response = llm.invoke(prompt_messages)
+    prompt_messages: list[BaseMessage] = [SUMMARY_SYSTEM_MESSAGE]
+    if state.truncated:
+        prompt_messages.append(
+            SystemMessage(
+                content=(
+                    f"The corpus file list was truncated to the first {len(state.corpus_data)} files; "
+                    "mention that the overview may be incomplete."
+                )
+            )
+        )
+    prompt_messages += state.messages
+    response = await llm.ainvoke(prompt_messages)
     return {"messages": [response]}
 
 
@@ -248,20 +299,24 @@ def _print_result_summary(result: dict) -> None:
             )
 
 
-def main():
+async def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
     # Create a simple graph: retrieve -> llm -> end
     g = StateGraph(GraphState)
 
     # Add nodes
     g.add_node("upload_node", upload_node)
+    g.add_node("prefetch_node", prefetch_node)
     g.add_node("determine_question_type", determine_question_type)
     g.add_node("corpus_data_node", corpus_data_node)
     g.add_node("retrieve_node", retrieve_node)
     g.add_node("summary_node", summary_node)
 
     # g.add_edge(START, "upload_node")
-    g.add_edge(START, "determine_question_type")
-    g.add_edge("upload_node", "determine_question_type")
+    g.add_edge(START, "prefetch_node")
+    g.add_edge("upload_node", "prefetch_node")
+    g.add_edge("prefetch_node", "determine_question_type")
     g.add_conditional_edges(
         "determine_question_type",
         route_by_question_type,
@@ -284,11 +339,11 @@ def main():
 
     # Run the graph
     print("\n" + "=" * 80)
-    result = lg_graph.invoke({"messages": [HumanMessage(content=user_input)]})
+    result = await lg_graph.ainvoke({"messages": [HumanMessage(content=user_input)]})
     print("=" * 80)
 
     _print_result_summary(result)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
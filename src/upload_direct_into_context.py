@@ -1,24 +1,52 @@
 import base64
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
 import os
 from pathlib import Path
-from typing import Annotated, Sequence
+from typing import Annotated, Optional, Sequence
 
 from dotenv import load_dotenv
 from langchain_core.messages import BaseMessage, HumanMessage
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from shared.lc_llm import get_lc_llm
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Multiple of 3 so each chunk encodes to base64 without padding
+PDF_READ_CHUNK_SIZE = 3 * 1024 * 1024
+
 
 class GraphState(BaseModel):
     """Simple state with just messages."""
 
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     messages: Annotated[Sequence[BaseMessage], add_messages]
     pdf_path: str = ""
+    # Base64 encoding of pdf_path, started before the graph runs
+    pdf_future: Optional[Future] = None
+
+
+def _read_and_encode(pdf_path: str) -> str:
+    """
+    Read a PDF and return it base64-encoded, encoding in 3-byte-aligned chunks so
+    the raw file is never held in memory alongside its encoding.
+    """
+    size = os.path.getsize(pdf_path)
+    encoded = bytearray(((size + 2) // 3) * 4)
+    pos = 0
+    with open(pdf_path, "rb") as f:
+        while chunk := f.read(PDF_READ_CHUNK_SIZE):
+            encoded_chunk = base64.b64encode(chunk)
+            encoded[pos : pos + len(encoded_chunk)] = encoded_chunk
+            pos += len(encoded_chunk)
+    del encoded[pos:]  # in case the file shrank while reading
+    return encoded.decode("ascii")
 
 
 def load_pdf_node(state: GraphState) -> dict:
@@ -27,17 +55,17 @@ def load_pdf_node(state: GraphState) -> dict:
     """
     pdf_path = state.pdf_path
     if not pdf_path or not os.path.exists(pdf_path):
-        print(f"[ERROR] PDF file not found: {pdf_path}")
+        logger.error("PDF file not found: %s", pdf_path)
         return {"messages": []}
 
-    print(f"[INFO] Loading and encoding PDF: {pdf_path}")
-
-    # Read and encode the PDF as base64
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    pdf_base64 = base64.b64encode(pdf_bytes).decode("utf-8")
+    logger.info("Loading and encoding PDF: %s", pdf_path)
+    if state.pdf_future is not None:
+        # Usually already done: the read started before the graph was built
+        pdf_base64 = state.pdf_future.result()
+    else:
+        pdf_base64 = _read_and_encode(pdf_path)
 
-    print(f"[INFO] PDF encoded, size: {len(pdf_base64)} characters")
+    logger.info("PDF encoded, size: %d characters", len(pdf_base64))
 
     # Create a message with the base64-encoded PDF
     message = HumanMessage(
@@ -64,6 +92,18 @@ def llm_node(state: GraphState) -> dict:
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+    # Use the specified PDF from files_to_upload directory
+    files_dir = Path(__file__).parent.parent / "files_to_upload"
+    pdf_path = str(files_dir / "20071229X02007.pdf")
+
+    # Start reading and encoding the PDF while the graph and LLM client are set up
+    executor = ThreadPoolExecutor(max_workers=1)
+    pdf_future = executor.submit(_read_and_encode, pdf_path)
+    executor.shutdown(wait=False)
+    get_lc_llm()  # cached, so llm_node reuses this client
+
     # Create a simple graph: load_pdf -> llm -> end
     g = StateGraph(GraphState)
 
@@ -79,10 +119,6 @@ def main():
     # Compile the graph
     lg_graph = g.compile()
 
-    # Use the specified PDF from files_to_upload directory
-    files_dir = Path(__file__).parent.parent / "files_to_upload"
-    pdf_path = str(files_dir / "20071229X02007.pdf")
-
     user_input = "What was the Runway Length of the airport? What page is this on?"
 
     print(f"Using PDF: {pdf_path}")
@@ -91,7 +127,11 @@ def main():
     # Run the graph
     print("\n" + "=" * 80)
     result = lg_graph.invoke(
-        {"messages": [HumanMessage(content=user_input)], "pdf_path": pdf_path}
+        {
+            "messages": [HumanMessage(content=user_input)],
+            "pdf_path": pdf_path,
+            "pdf_future": pdf_future,
+        }
     )
     print("=" * 80)
 